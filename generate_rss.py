@@ -3,53 +3,155 @@
 Generador de feed RSS para el podcast "De Nit" de RTVE.
 """
 
+import copy
 import json
 from datetime import datetime, timezone
-from feedgen.feed import FeedGenerator
-from dateutil import parser as date_parser
+from email.utils import format_datetime
+from functools import lru_cache
+from lxml import etree
 import re
-from typing import List, Dict
+from typing import List, Dict, Optional
 from urllib.parse import urlparse, urlunparse
 
+try:
+    import orjson
+except ImportError:  # orjson es opcional: se usa json de la librería estándar
+    orjson = None
+
+
+ITUNES_NS = 'http://www.itunes.com/dtds/podcast-1.0.dtd'
+ATOM_NS = 'http://www.w3.org/2005/Atom'
+
+# Tipo MIME del audio según la extensión de la URL
+_MIME_BY_EXT = {'m4a': 'audio/mp4', 'ogg': 'audio/ogg', 'mp3': 'audio/mpeg'}
+
+
+def _itunes(tag: str) -> str:
+    """Nombre cualificado de un elemento del espacio de nombres de iTunes."""
+    return f'{{{ITUNES_NS}}}{tag}'
+
+
+def _sub_element(parent: etree._Element, tag: str, text: Optional[str] = None,
+                 attrib: Optional[Dict[str, str]] = None) -> etree._Element:
+    """Crea un subelemento con texto y atributos opcionales."""
+    element = etree.SubElement(parent, tag, attrib or {})
+    if text is not None:
+        element.text = text
+    return element
+
+
+# Muchos episodios comparten duración y fecha: se cachea el resultado por string
+@lru_cache(maxsize=4096)
+def _parse_duration_cached(duration_str: str) -> str:
+    """Convierte duración ISO 8601 (PT1H2M3S) a formato HH:MM:SS."""
+    if not duration_str or not duration_str.startswith('PT'):
+        return '00:00:00'
+
+    # Recorrer PT#H#M#S una sola vez acumulando dígitos
+    hours = minutes = seconds = 0
+    value = 0
+    fraction = False
+    for char in duration_str[2:]:
+        if '0' <= char <= '9':
+            if not fraction:
+                value = value * 10 + ord(char) - 48
+        elif char == 'H':
+            hours, value = value, 0
+        elif char == 'M':
+            minutes, value = value, 0
+        elif char == 'S':
+            seconds, value, fraction = value, 0, False
+        elif char in '.,':
+            # Los segundos fraccionarios se truncan
+            fraction = True
+        else:
+            return '00:00:00'
+
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+@lru_cache(maxsize=4096)
+def _parse_date_cached(date_str: str) -> Optional[datetime]:
+    """Parsea una fecha a datetime con timezone, o None si no es válida."""
+    try:
+        # Camino rápido: las fechas de RTVE suelen venir en ISO 8601
+        dt = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+    except ValueError:
+        # dateutil solo se importa si el formato no es ISO 8601
+        from dateutil import parser as date_parser
+        try:
+            dt = date_parser.parse(date_str)
+        except Exception:
+            return None
+
+    # Si el datetime no tiene timezone, asignar UTC
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+@lru_cache(maxsize=None)
+def _podcast_template() -> etree._Element:
+    """Elemento <rss> con los metadatos del podcast, construido una sola vez."""
+    rss = etree.Element('rss', nsmap={'itunes': ITUNES_NS, 'atom': ATOM_NS})
+    rss.set('version', '2.0')
+    RSSGenerator._setup_podcast_metadata(etree.SubElement(rss, 'channel'))
+    return rss
+
 
 class RSSGenerator:
     """Generador de feed RSS 2.0 para podcasts."""
     
+    PODCAST_IMAGE = 'https://img2.rtve.es/imagenes/de-nit/1625484441092.jpg'
+    
     def __init__(self):
         """Inicializa el generador de RSS."""
-        self.fg = FeedGenerator()
-        self._setup_podcast_metadata()
+        # Los metadatos son constantes: se copian de la plantilla ya configurada
+        self.rss = copy.deepcopy(_podcast_template())
+        self.channel = self.rss.find('channel')
+        self._items_index = len(self.channel)
     
-    def _setup_podcast_metadata(self):
+    @staticmethod
+    def _setup_podcast_metadata(channel: etree._Element):
         """Configura los metadatos del podcast."""
-        self.fg.load_extension('podcast')
+        program_url = 'https://www.rtve.es/play/audios/de-nit/'
+        feed_url = 'https://raw.githubusercontent.com/sergioedo/rss-la-nit/main/feed.xml'
         
         # Metadatos básicos del feed
-        self.fg.title('De Nit - RNE 4')
-        self.fg.description(
+        _sub_element(channel, 'title', 'De Nit - RNE 4')
+        _sub_element(channel, 'link', program_url)
+        _sub_element(
+            channel, 'description',
             'De Nit és el programa nocturn de RNE 4 (Catalunya Ràdio). '
             'Música, tertúlies i molt més durant la nit.'
         )
-        self.fg.author({'name': 'RTVE - Ràdio Nacional d\'Espanya'})
-        self.fg.link(href='https://www.rtve.es/play/audios/de-nit/', rel='alternate')
-        self.fg.link(href='https://raw.githubusercontent.com/sergioedo/rss-la-nit/main/feed.xml', rel='self')
-        self.fg.language('ca')
-        self.fg.copyright('© RTVE')
+        _sub_element(channel, f'{{{ATOM_NS}}}link', attrib={'href': feed_url, 'rel': 'self'})
+        _sub_element(channel, 'copyright', '© RTVE')
+        _sub_element(channel, 'docs', 'http://www.rssboard.org/rss-specification')
+        
+        # Imagen del podcast
+        image = _sub_element(channel, 'image')
+        _sub_element(image, 'url', RSSGenerator.PODCAST_IMAGE)
+        _sub_element(image, 'title', 'De Nit')
+        _sub_element(image, 'link', program_url)
+        
+        _sub_element(channel, 'language', 'ca')
+        # Se rellena al generar el fichero
+        _sub_element(channel, 'lastBuildDate')
         
         # Metadatos de podcast (iTunes)
-        self.fg.podcast.itunes_author('RTVE')
-        self.fg.podcast.itunes_category('Music')
-        self.fg.podcast.itunes_explicit('no')
-        self.fg.podcast.itunes_owner(name='RTVE', email='info@rtve.es')
-        self.fg.podcast.itunes_summary(
+        _sub_element(channel, _itunes('author'), 'RTVE')
+        _sub_element(channel, _itunes('category'), attrib={'text': 'Music'})
+        _sub_element(channel, _itunes('image'), attrib={'href': RSSGenerator.PODCAST_IMAGE})
+        _sub_element(channel, _itunes('explicit'), 'no')
+        owner = _sub_element(channel, _itunes('owner'))
+        _sub_element(owner, _itunes('name'), 'RTVE')
+        _sub_element(owner, _itunes('email'), 'info@rtve.es')
+        _sub_element(
+            channel, _itunes('summary'),
             'De Nit és el programa nocturn de RNE 4. '
             'Feed RSS no oficial generat automàticament.'
         )
-        
-        # Imagen del podcast
-        podcast_image = 'https://img2.rtve.es/imagenes/de-nit/1625484441092.jpg'
-        self.fg.image(url=podcast_image, title='De Nit', link='https://www.rtve.es/play/audios/de-nit/')
-        self.fg.podcast.itunes_image(podcast_image)
     
     def _parse_duration(self, duration_str: str) -> str:
         """
@@ -61,20 +163,7 @@ class RSSGenerator:
         Returns:
             Duración en formato HH:MM:SS
         """
-        if not duration_str:
-            return '00:00:00'
-        
-        # Parsear formato ISO 8601 (PT1H2M3S)
-        pattern = r'PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?'
-        match = re.match(pattern, duration_str)
-        
-        if match:
-            hours = int(match.group(1) or 0)
-            minutes = int(match.group(2) or 0)
-            seconds = int(match.group(3) or 0)
-            return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-        
-        return '00:00:00'
+        return _parse_duration_cached(duration_str)
     
     def _parse_date(self, date_str: str) -> datetime:
         """
@@ -89,19 +178,12 @@ class RSSGenerator:
         if not date_str:
             return datetime.now(timezone.utc)
         
-        try:
-            dt = date_parser.parse(date_str)
-            # Si el datetime no tiene timezone, asignar UTC
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
-            return dt
-        except Exception:
-            return datetime.now(timezone.utc)
+        return _parse_date_cached(date_str) or datetime.now(timezone.utc)
     
     def _sanitize_image_url(self, image_url: str) -> str:
         """
-        Sanitiza la URL de imagen para cumplir con los requisitos de feedgen/iTunes.
-        La librería feedgen requiere que las URLs terminen en .jpg o .png (minúsculas).
+        Sanitiza la URL de imagen para cumplir con los requisitos de iTunes.
+        iTunes solo acepta imágenes cuyas URLs terminen en .jpg o .png (minúsculas).
         
         Args:
             image_url: URL de la imagen original
@@ -117,7 +199,7 @@ class RSSGenerator:
         # Reconstruct URL without query string and fragment
         clean_url = urlunparse((parsed.scheme, parsed.netloc, parsed.path, '', '', ''))
         
-        # Normalize extension to lowercase .jpg or .png (feedgen requirement)
+        # Normalize extension to lowercase .jpg or .png (iTunes requirement)
         # Accept .jpg, .jpeg (same format), and .png (case-insensitive)
         jpg_match = re.search(r'\.jpe?g$', clean_url, re.IGNORECASE)
         png_match = re.search(r'\.png$', clean_url, re.IGNORECASE)
@@ -140,57 +222,55 @@ class RSSGenerator:
         Args:
             episode_data: Diccionario con los datos del episodio
         """
-        fe = self.fg.add_entry()
+        item = etree.Element('item')
         
         # Datos básicos
         title = episode_data.get('title', 'Sin título')
-        fe.title(title)
-        
-        description = episode_data.get('description', '')
-        fe.description(description)
+        _sub_element(item, 'title', title)
         
         # URL del episodio
         episode_url = episode_data.get('url', '')
         if episode_url:
-            fe.link(href=episode_url)
+            _sub_element(item, 'link', episode_url)
+        
+        description = episode_data.get('description', '')
+        if description:
+            _sub_element(item, 'description', description)
         
         # ID único
         episode_id = episode_data.get('id', '')
-        guid = episode_url if episode_url else f"de-nit-{episode_id}"
-        fe.guid(guid, permalink=True)
-        
-        # Fecha de publicación
-        pub_date = self._parse_date(episode_data.get('pub_date', ''))
-        fe.pubDate(pub_date)
+        if episode_url:
+            _sub_element(item, 'guid', episode_url, attrib={'isPermaLink': 'true'})
+        else:
+            _sub_element(item, 'guid', f"de-nit-{episode_id}", attrib={'isPermaLink': 'false'})
         
         # Audio enclosure
         audio_url = episode_data.get('audio_url')
         if audio_url:
             # Determinar tipo MIME
-            mime_type = 'audio/mpeg'
-            if audio_url.endswith('.m4a'):
-                mime_type = 'audio/mp4'
-            elif audio_url.endswith('.ogg'):
-                mime_type = 'audio/ogg'
+            mime_type = _MIME_BY_EXT.get(audio_url.rsplit('.', 1)[-1].lower(), 'audio/mpeg')
             
-            fe.enclosure(url=audio_url, type=mime_type, length='0')
+            _sub_element(item, 'enclosure', attrib={'url': audio_url, 'length': '0', 'type': mime_type})
         
-        # Duración (iTunes)
-        duration = episode_data.get('duration', '')
-        if duration:
-            duration_formatted = self._parse_duration(duration)
-            fe.podcast.itunes_duration(duration_formatted)
+        # Fecha de publicación
+        pub_date = self._parse_date(episode_data.get('pub_date', ''))
+        _sub_element(item, 'pubDate', format_datetime(pub_date))
         
-        # Imagen del episodio
+        # Imagen del episodio (se omite si es la misma que la del podcast)
         image_url = episode_data.get('image_url')
-        if image_url:
+        if image_url and image_url != self.PODCAST_IMAGE:
             # Sanitize image URL: remove query params, normalize extension to .jpg/.png
             sanitized_url = self._sanitize_image_url(image_url)
-            if sanitized_url:
-                fe.podcast.itunes_image(sanitized_url)
+            if sanitized_url and sanitized_url != self.PODCAST_IMAGE:
+                _sub_element(item, _itunes('image'), attrib={'href': sanitized_url})
+        
+        # Duración (iTunes)
+        duration = episode_data.get('duration', '')
+        if duration:
+            _sub_element(item, _itunes('duration'), self._parse_duration(duration))
         
-        # Autor
-        fe.author({'name': 'RTVE'})
+        # El último episodio añadido queda el primero del feed
+        self.channel.insert(self._items_index, item)
     
     def add_episodes(self, episodes: List[Dict]):
         """
@@ -209,7 +289,9 @@ class RSSGenerator:
         Args:
             output_file: Ruta del archivo de salida
         """
-        self.fg.rss_file(output_file, pretty=True)
+        self.channel.find('lastBuildDate').text = format_datetime(datetime.now(timezone.utc))
+        # Serializar directamente al fichero, sin construir el XML en memoria
+        etree.ElementTree(self.rss).write(output_file, pretty_print=True, xml_declaration=True, encoding='UTF-8')
         print(f"✓ Feed RSS generado: {output_file}")
 
 
@@ -227,8 +309,9 @@ def main():
     
     # Cargar episodios
     try:
-        with open(args.input, 'r', encoding='utf-8') as f:
-            episodes = json.load(f)
+        with open(args.input, 'rb') as f:
+            data = f.read()
+        episodes = orjson.loads(data) if orjson else json.loads(data)
     except FileNotFoundError:
         print(f"Error: No se encontró el archivo {args.input}. Ejecuta primero el scraper para generar los datos de episodios.")
         return
@@ -5,47 +5,146 @@ Scraper para extraer información de episodios del podcast "De Nit" de RTVE.
 
 import html
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import List, Dict, Optional
 from urllib.parse import urljoin
 
+try:
+    import orjson
+except ImportError:  # orjson es opcional: se usa json de la librería estándar
+    orjson = None
+
+
+# Tipos JSON-LD que describen un episodio
+_JSON_LD_TYPES = ('AudioObject', 'Episode', 'PodcastEpisode', 'RadioEpisode')
+
+# Bloques JSON-LD del HTML, para leerlos sin construir el árbol completo
+_JSON_LD_RE = re.compile(
+    r'<script[^>]*type=["\']application/ld\+json["\'][^>]*>(.*?)</script>',
+    re.IGNORECASE | re.DOTALL
+)
+
+# ID numérico al final de la URL del episodio (.../de-nit/<slug>/NNNNNN/)
+_ID_RE = re.compile(r'/(\d+)/?$')
+
+
+def _duration_from_ms(duration_ms) -> Optional[str]:
+    """Convierte una duración en milisegundos (API de RTVE) a ISO 8601."""
+    if not duration_ms:
+        return None
+    seconds = int(duration_ms) // 1000
+    hours = seconds // 3600
+    minutes = (seconds % 3600) // 60
+    secs = seconds % 60
+    return f"PT{hours}H{minutes}M{secs}S"
+
 
 class DeNitScraper:
     """Scraper para el programa De Nit de RTVE."""
     
     BASE_URL = "https://www.rtve.es"
     PROGRAM_URL = "https://www.rtve.es/play/audios/de-nit/"
+    PROGRAM_API_URL = "https://api2.rtve.es/api/programas/{program_id}/audios.json"
     
-    def __init__(self, delay: float = 1.0):
+    def __init__(self, delay: float = 1.0, workers: int = 8, program_id: Optional[str] = None,
+                 cache_file: Optional[str] = None):
         """
         Inicializa el scraper.
         
         Args:
             delay: Tiempo de espera entre peticiones (en segundos)
+            workers: Número de episodios que se descargan en paralelo
+            program_id: ID del programa en la API de RTVE; si se indica, los
+                episodios se obtienen de la API en lugar de las páginas HTML
+            cache_file: Fichero con ETag/Last-Modified y datos de episodios ya
+                procesados, para hacer peticiones condicionales entre ejecuciones
         """
         self.delay = delay
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (compatible; RSSFeedBot/1.0; +https://github.com/sergioedo/rss-la-nit)'
+        self.workers = max(1, workers)
+        self.program_id = program_id
+        # requests.Session no es thread-safe: una sesión por hilo
+        self._local = threading.local()
+        self._throttle_lock = threading.Lock()
+        self._next_request = 0.0
+        self.cache_file = cache_file
+        self._http_cache = self._load_cache()
+        self._cache_lock = threading.Lock()
+        self._cache_used = set()
+    
+    def _load_cache(self) -> Dict:
+        if not self.cache_file:
+            return {}
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+    
+    def save_cache(self):
+        """Guarda en disco la caché de las páginas usadas en esta ejecución."""
+        # Si no se procesó ninguna página (p. ej. sin conexión) se conserva la caché
+        if not self.cache_file or not self._cache_used:
+            return
+        cache = {url: entry for url, entry in self._http_cache.items() if url in self._cache_used}
+        with open(self.cache_file, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False)
+    
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
+        session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (compatible; RSSFeedBot/1.0; +https://github.com/sergioedo/rss-la-nit)',
+            'Accept-Encoding': 'gzip, deflate'
         })
+        # Reintentos ante errores 5xx. Cada hilo tiene su propia sesión, así que el
+        # keep-alive es por hilo y el pool por defecto basta (una petición a la vez)
+        adapter = HTTPAdapter(
+            max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504])
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+    
+    @property
+    def session(self) -> requests.Session:
+        """Sesión HTTP del hilo actual."""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._create_session()
+        return session
     
-    def _extract_json_data(self, soup: BeautifulSoup) -> Optional[Dict]:
-        scripts = soup.find_all('script', type='application/ld+json')
-        for script in scripts:
+    def _throttle(self):
+        """Espacia las peticiones al menos `delay` segundos entre todos los hilos."""
+        with self._throttle_lock:
+            now = time.monotonic()
+            start = max(now, self._next_request)
+            self._next_request = start + self.delay
+        if start > now:
+            time.sleep(start - now)
+    
+    def _extract_json_data(self, page_html: str) -> Optional[Dict]:
+        for match in _JSON_LD_RE.finditer(page_html):
+            text = match.group(1)
+            # Evitar json.loads en bloques que no pueden ser de un episodio
+            if not text or '"@type"' not in text or not any(t in text for t in _JSON_LD_TYPES):
+                continue
             try:
-                data = json.loads(script.string)
-                if data.get('@type') in ['AudioObject', 'Episode', 'PodcastEpisode', 'RadioEpisode']:
+                data = json.loads(text)
+                if data.get('@type') in _JSON_LD_TYPES:
                     return data
             except (json.JSONDecodeError, AttributeError):
                 continue
         return None
     
-    def _extract_audio_url(self, soup: BeautifulSoup, episode_id: str) -> Optional[str]:
-        json_data = self._extract_json_data(soup)
+    def _extract_audio_url(self, page_html: Optional[str], episode_id: str, json_data: Optional[Dict] = None) -> Optional[str]:
+        if json_data is None and page_html:
+            json_data = self._extract_json_data(page_html)
         if json_data and 'contentUrl' in json_data:
             content_url = json_data['contentUrl']
             if content_url and not content_url.endswith('/'):
@@ -79,16 +178,41 @@ class DeNitScraper:
 
     def get_episode_details(self, episode_url: str) -> Optional[Dict]:
         try:
-            time.sleep(self.delay)
+            self._throttle()
             
-            response = self.session.get(episode_url, timeout=10)
+            # Petición condicional: si la página no ha cambiado se reutilizan los datos
+            cached = self._http_cache.get(episode_url)
+            headers = {}
+            if cached:
+                if cached.get('etag'):
+                    headers['If-None-Match'] = cached['etag']
+                if cached.get('last_modified'):
+                    headers['If-Modified-Since'] = cached['last_modified']
+            
+            response = self.session.get(episode_url, timeout=10, headers=headers)
+            if response.status_code == 304 and cached:
+                with self._cache_lock:
+                    self._cache_used.add(episode_url)
+                return cached['episode']
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.content, 'html.parser')
+            # RTVE sirve sus páginas en UTF-8
+            page_html = response.content.decode('utf-8', errors='replace')
+            
+            # El HTML solo se parsea si JSON-LD y la API no bastan
+            soup = None
             
-            episode_id = episode_url.rstrip('/').split('/')[-1]
+            def get_soup():
+                nonlocal soup
+                if soup is None:
+                    from bs4 import BeautifulSoup
+                    soup = BeautifulSoup(page_html, 'lxml')
+                return soup
             
-            json_data = self._extract_json_data(soup)
+            match = _ID_RE.search(episode_url)
+            episode_id = match.group(1) if match else episode_url.rstrip('/').rsplit('/', 1)[-1]
+            
+            json_data = self._extract_json_data(page_html)
             api_data = self._fetch_api_data(episode_id)
             
             title = None
@@ -97,7 +221,7 @@ class DeNitScraper:
             elif api_data and 'title' in api_data:
                 title = html.unescape(api_data['title'])
             else:
-                title_tag = soup.find('h1', class_='title') or soup.find('h1')
+                title_tag = get_soup().find('h1', class_='title') or get_soup().find('h1')
                 title = title_tag.text.strip() if title_tag else None
             
             description = None
@@ -108,7 +232,7 @@ class DeNitScraper:
             elif json_data and 'description' in json_data:
                 description = html.unescape(json_data['description'])
             else:
-                desc_tag = soup.find('meta', {'name': 'description'})
+                desc_tag = get_soup().find('meta', {'name': 'description'})
                 if desc_tag:
                     description = desc_tag.get('content', '').strip()
             
@@ -120,7 +244,7 @@ class DeNitScraper:
             elif api_data and 'publicationDate' in api_data:
                 pub_date = api_data['publicationDate']
             else:
-                date_tag = soup.find('time')
+                date_tag = get_soup().find('time')
                 if date_tag:
                     pub_date = date_tag.get('datetime', '')
             
@@ -128,13 +252,7 @@ class DeNitScraper:
             if json_data and 'audio' in json_data and isinstance(json_data['audio'], list) and len(json_data['audio']) > 0:
                 duration = json_data['audio'][0].get('duration')
             elif api_data and 'duration' in api_data:
-                duration_ms = api_data['duration']
-                if duration_ms:
-                    seconds = int(duration_ms) // 1000
-                    hours = seconds // 3600
-                    minutes = (seconds % 3600) // 60
-                    secs = seconds % 60
-                    duration = f"PT{hours}H{minutes}M{secs}S"
+                duration = _duration_from_ms(api_data['duration'])
             
             image_url = None
             if json_data and 'image' in json_data:
@@ -144,7 +262,7 @@ class DeNitScraper:
             elif json_data and 'audio' in json_data and isinstance(json_data['audio'], list) and len(json_data['audio']) > 0:
                 image_url = json_data['audio'][0].get('thumbnailUrl')
             else:
-                img_tag = soup.find('meta', {'property': 'og:image'})
+                img_tag = get_soup().find('meta', {'property': 'og:image'})
                 if img_tag:
                     image_url = img_tag.get('content', '')
             
@@ -152,7 +270,7 @@ class DeNitScraper:
             if api_data and 'qualities' in api_data and len(api_data['qualities']) > 0:
                 audio_url = api_data['qualities'][0].get('filePath')
             if not audio_url:
-                audio_url = self._extract_audio_url(soup, episode_id)
+                audio_url = self._extract_audio_url(page_html, episode_id, json_data=json_data)
             
             if not title:
                 print(f"Error: No se pudo extraer el título del episodio desde {episode_url}. El episodio será omitido.")
@@ -169,12 +287,134 @@ class DeNitScraper:
                 'audio_url': audio_url
             }
             
+            # Sin audio no se cachea: el ETag de la página no cubre la API de audios,
+            # así que el episodio se vuelve a procesar hasta que el audio esté publicado
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if self.cache_file and audio_url and (etag or last_modified):
+                with self._cache_lock:
+                    self._cache_used.add(episode_url)
+                    self._http_cache[episode_url] = {
+                        'etag': etag,
+                        'last_modified': last_modified,
+                        'episode': episode_data
+                    }
+            
             return episode_data
             
         except Exception as e:
             print(f"Error al procesar episodio {episode_url}: {e}. Saltando al siguiente episodio.")
             return None
     
+    def _episode_from_api(self, item: Dict) -> Optional[Dict]:
+        """
+        Construye los datos de un episodio a partir de un elemento de la API.
+        
+        Args:
+            item: Elemento de la lista de audios de la API de RTVE
+            
+        Returns:
+            Diccionario con datos del episodio, o None si no tiene título o es inválido
+        """
+        try:
+            episode_id = str(item.get('id', ''))
+            title = item.get('title') or item.get('longTitle')
+            if not episode_id or not title:
+                return None
+            
+            audio_url = None
+            if item.get('qualities'):
+                audio_url = item['qualities'][0].get('filePath')
+            if not audio_url:
+                self._throttle()
+                audio_url = self._extract_audio_url(None, episode_id)
+            
+            return {
+                'id': episode_id,
+                'url': item.get('htmlUrl', ''),
+                'title': html.unescape(title),
+                'description': html.unescape(re.sub(r'<[^>]+>', '', item.get('description') or '')),
+                'pub_date': item.get('publicationDate'),
+                'duration': _duration_from_ms(item.get('duration')),
+                'image_url': item.get('imageSEO') or item.get('thumbnail'),
+                'audio_url': audio_url
+            }
+        except Exception as e:
+            print(f"Error al procesar episodio {item.get('id') if isinstance(item, dict) else item} desde API: {e}. Saltando al siguiente episodio.")
+            return None
+    
+    def _list_episodes_via_api(self, max_episodes: int) -> List[Optional[Dict]]:
+        """
+        Obtiene los episodios desde la API de programas de RTVE, sin
+        descargar la página HTML de cada episodio.
+        
+        Args:
+            max_episodes: Número máximo de episodios a obtener
+            
+        Returns:
+            Lista de datos de episodios (vacía si la API no responde)
+        """
+        try:
+            api_url = self.PROGRAM_API_URL.format(program_id=self.program_id)
+            response = self.session.get(api_url, params={'size': max_episodes}, timeout=10)
+            response.raise_for_status()
+            items = response.json().get('page', {}).get('items', [])[:max_episodes]
+        except Exception as e:
+            print(f"Error al obtener episodios desde API para programa {self.program_id}: {e}")
+            return []
+        
+        print(f"Encontrados {len(items)} episodios en la API")
+        
+        # Las filas sin audio consultan la API de audios: en paralelo y con throttle
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(self._episode_from_api, items))
+    
+    def _scrape_episode_pages(self, max_episodes: int) -> List[Optional[Dict]]:
+        """
+        Obtiene los episodios a partir de las páginas HTML del programa.
+        
+        Args:
+            max_episodes: Número máximo de episodios a obtener
+            
+        Returns:
+            Lista de datos de episodios (None para los que fallan)
+        """
+        import lxml.html
+        
+        # Obtener la página principal del programa, parseándola según llega
+        with self.session.get(self.PROGRAM_URL, timeout=10, stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            document = lxml.html.parse(response.raw).getroot()
+        
+        # Buscar enlaces a episodios
+        episode_links = []
+        seen = set()
+        
+        for href in document.xpath('//a[contains(@href, "/play/audios/de-nit/")]/@href'):
+            # Los enlaces suelen ser rutas absolutas: basta con concatenar
+            if href.startswith('/') and not href.startswith('//'):
+                full_url = self.BASE_URL + href
+            else:
+                full_url = urljoin(self.BASE_URL, href)
+            if full_url != self.PROGRAM_URL and full_url not in seen:
+                seen.add(full_url)
+                episode_links.append(full_url)
+        
+        # Limitar al número máximo de episodios
+        episode_links = episode_links[:max_episodes]
+        
+        print(f"Encontrados {len(episode_links)} episodios")
+        
+        def fetch(indexed_url):
+            i, episode_url = indexed_url
+            print(f"Procesando episodio {i+1}/{len(episode_links)}: {episode_url}")
+            return self.get_episode_details(episode_url)
+        
+        # Obtener detalles de los episodios en paralelo (map conserva el orden)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(fetch, enumerate(episode_links)))
+    
     def get_episodes_list(self, max_episodes: int = 50, description_filter: Optional[str] = None) -> List[Dict]:
         """
         Obtiene la lista de episodios del programa.
@@ -189,40 +429,23 @@ class DeNitScraper:
         episodes = []
         
         try:
-            # Obtener la página principal del programa
-            response = self.session.get(self.PROGRAM_URL, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Buscar enlaces a episodios
-            episode_links = []
-            
-            # Buscar en diferentes patrones posibles
-            for link in soup.find_all('a', href=True):
-                href = link['href']
-                if '/play/audios/de-nit/' in href and href != self.PROGRAM_URL:
-                    full_url = urljoin(self.BASE_URL, href)
-                    if full_url not in episode_links:
-                        episode_links.append(full_url)
-            
-            # Limitar al número máximo de episodios
-            episode_links = episode_links[:max_episodes]
-            
-            print(f"Encontrados {len(episode_links)} episodios")
-            
             if description_filter:
                 print(f"Filtro de descripción activo: '{description_filter}'")
             
-            # Obtener detalles de cada episodio
-            for i, episode_url in enumerate(episode_links):
-                print(f"Procesando episodio {i+1}/{len(episode_links)}: {episode_url}")
-                episode_data = self.get_episode_details(episode_url)
-                if episode_data:
-                    if description_filter and not episode_data['description'].startswith(description_filter):
-                        print(f"  -> Omitido (descripción no empieza con '{description_filter}')")
-                        continue
-                    episodes.append(episode_data)
+            results = []
+            if self.program_id:
+                results = self._list_episodes_via_api(max_episodes)
+            if not any(results):
+                # Sin API (o sin episodios válidos): scraping de las páginas HTML
+                results = self._scrape_episode_pages(max_episodes)
+            
+            for episode_data in results:
+                if not episode_data:
+                    continue
+                if description_filter and not episode_data['description'].startswith(description_filter):
+                    print(f"  -> Omitido: {episode_data['title']} (descripción no empieza con '{description_filter}')")
+                    continue
+                episodes.append(episode_data)
             
         except Exception as e:
             print(f"Error al obtener lista de episodios: {e}")
@@ -241,17 +464,29 @@ def main():
                       help='Archivo de salida JSON (default: episodes.json)')
     parser.add_argument('--delay', type=float, default=1.0,
                       help='Delay entre peticiones en segundos (default: 1.0)')
+    parser.add_argument('--workers', type=int, default=8,
+                      help='Episodios descargados en paralelo (default: 8)')
     parser.add_argument('--description-filter', type=str, default=None,
                       help='Solo incluir episodios cuya descripción empiece con este texto')
+    parser.add_argument('--program-id', type=str, default=None,
+                      help='ID del programa en la API de RTVE para obtener los episodios sin scraping HTML')
+    parser.add_argument('--cache', type=str, default='.scraper_cache.json',
+                      help='Caché de peticiones condicionales entre ejecuciones, vacío para desactivarla (default: .scraper_cache.json)')
     
     args = parser.parse_args()
     
-    scraper = DeNitScraper(delay=args.delay)
+    scraper = DeNitScraper(delay=args.delay, workers=args.workers, program_id=args.program_id,
+                           cache_file=args.cache or None)
     episodes = scraper.get_episodes_list(max_episodes=args.max_episodes, description_filter=args.description_filter)
+    scraper.save_cache()
     
     # Guardar resultados
-    with open(args.output, 'w', encoding='utf-8') as f:
-        json.dump(episodes, f, ensure_ascii=False, indent=2)
+    if orjson:
+        with open(args.output, 'wb') as f:
+            f.write(orjson.dumps(episodes, option=orjson.OPT_INDENT_2))
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(episodes, f, ensure_ascii=False, indent=2)
     
     print(f"\n✓ {len(episodes)} episodios guardados en {args.output}")
 